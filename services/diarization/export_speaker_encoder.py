@@ -0,0 +1,132 @@
+"""
+Speaker Encoder Export
+Exports XTTS v2's speaker encoder (mel -> embedding) to ONNX for main.py.
+
+Kept apart from main.py so the Docker image can run it in a layer that does
+not depend on main.py, and editing the service doesn't re-download XTTS.
+"""
+import inspect
+import logging
+import os
+from pathlib import Path
+import numpy as np
+import torch
+
+logger = logging.getLogger("diarization")
+
+# Mel bins the encoder's network takes (main.MEL_N_MELS)
+MEL_N_MELS = 64
+# Rate of the waveforms the encoder takes (main.SAMPLE_RATE)
+SAMPLE_RATE = 16000
+# Length of the reference waveform saved alongside the export
+REFERENCE_SECONDS = 3
+
+def reference_path(onnx_path: str) -> str:
+    """Where the reference waveform and its XTTS embedding for onnx_path are stored"""
+    return os.path.splitext(onnx_path)[0] + ".reference.npz"
+
+def reference_waveform() -> np.ndarray:
+    """Deterministic voiced-like test signal: a 110 Hz harmonic stack with vibrato plus noise"""
+    rng = np.random.default_rng(0)
+    t = np.arange(REFERENCE_SECONDS * SAMPLE_RATE) / SAMPLE_RATE
+    phase = 2 * np.pi * (110 * t + 2 * np.sin(2 * np.pi * 5 * t))
+    wave = sum(np.sin(k * phase) / k for k in range(1, 11))
+    wave = 0.3 * wave / np.abs(wave).max() + 0.01 * rng.standard_normal(t.shape)
+    return wave.astype(np.float32)
+
+def load_xtts():
+    """Load the full Coqui XTTS v2 model on CPU (only needed to export the speaker encoder)"""
+    from TTS.utils.manage import ModelManager
+    from TTS.tts.models import setup_model as setup_tts_model
+    from TTS.config import load_config
+
+    logger.info("🔧 Loading Coqui TTS model for speaker encoder export...")
+
+    # Check for model path in environment
+    model_path = os.environ.get('COQUI_MODEL_PATH')
+
+    if not model_path or not Path(model_path).exists():
+        logger.warning("⚠️  COQUI_MODEL_PATH not set or invalid, downloading model...")
+        manager = ModelManager()
+        model_path, _, _ = manager.download_model("tts_models/multilingual/multi-dataset/xtts_v2")
+        logger.info("📥 Downloaded model to: %s", model_path)
+        # Config path is always in the model directory
+        config_path = Path(model_path) / "config.json"
+        logger.info("📝 Config path: %s", config_path)
+    else:
+        model_path = Path(model_path)
+        config_path = model_path / "config.json"
+        logger.info("✅ Using model from: %s", model_path)
+
+    # Load config and setup model
+    logger.info("📖 Loading config from: %s", config_path)
+    config = load_config(str(config_path))
+    logger.info("🏗️  Setting up model...")
+    xtts = setup_tts_model(config)
+    logger.info("💾 Loading checkpoint from: %s", model_path)
+
+    # Patch torch.load to use weights_only=False for XTTS (trusted source)
+    original_torch_load = torch.load
+    def patched_load(*args, **kwargs):
+        kwargs['weights_only'] = False
+        return original_torch_load(*args, **kwargs)
+
+    torch.load = patched_load
+    try:
+        xtts.load_checkpoint(
+            config,
+            checkpoint_dir=str(model_path),
+            eval=True,
+        )
+    finally:
+        torch.load = original_torch_load
+
+    return xtts
+
+def export_speaker_encoder(onnx_path: str) -> None:
+    """One-time export of XTTS v2's speaker encoder (mel -> embedding) to ONNX.
+
+    Also saves a reference waveform and the embedding the original torch encoder
+    (its own waveform front end included) gives it, next to the ONNX file. main.py
+    checks that its mel front end plus the ONNX network reproduce that embedding.
+    """
+    speaker_encoder = load_xtts().hifigan_decoder.speaker_encoder.cpu().eval()
+
+    waveform = reference_waveform()
+    with torch.inference_mode():
+        embedding = speaker_encoder(torch.from_numpy(waveform).unsqueeze(0), l2_norm=True)[0].numpy()
+    np.savez(reference_path(onnx_path), waveform=waveform, embedding=embedding.astype(np.float32))
+
+    # The mel front end runs in main.OnnxSpeakerEncoder.compute_mel; export only the network
+    speaker_encoder.use_torch_spec = False
+
+    class MelToEmbedding(torch.nn.Module):
+        def __init__(self, encoder):
+            super().__init__()
+            self.encoder = encoder
+
+        def forward(self, mel):
+            return self.encoder(mel, l2_norm=True)
+
+    logger.info("📦 Exporting speaker encoder to ONNX: %s", onnx_path)
+    tmp_path = onnx_path + ".tmp"
+    torch.onnx.export(
+        MelToEmbedding(speaker_encoder),
+        (torch.rand(1, MEL_N_MELS, 200),),
+        tmp_path,
+        input_names=["mel"],
+        output_names=["embedding"],
+        dynamic_axes={"mel": {0: "B", 2: "T"}, "embedding": {0: "B"}},
+        opset_version=17,
+        # Newer torch defaults to the dynamo exporter; the TorchScript one needs no extra deps
+        **({"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}),
+    )
+    os.replace(tmp_path, onnx_path)
+    logger.info("✅ Speaker encoder exported")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    export_speaker_encoder(os.environ.get(
+        'SPEAKER_ENCODER_ONNX_PATH',
+        str(Path(__file__).resolve().parent / "speaker_encoder.onnx"),
+    ))
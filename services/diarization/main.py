@@ -2,69 +2,119 @@
 Speaker Diarization Microservice
 Uses WhoSpeaks for speaker identification
 """
+import gc
+import hashlib
+import logging
 import os
 import tempfile
-import shutil
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import numpy as np
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import librosa
 import torch
-import soundfile as sf
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import AgglomerativeClustering
-from scipy.cluster.hierarchy import linkage, dendrogram
-from scipy.spatial.distance import pdist
-from TTS.utils.manage import ModelManager
-from TTS.tts.models import setup_model as setup_tts_model
-from TTS.config import load_config
-
-# ---- Monkey-patch torchaudio.load to use soundfile ----
-# torchaudio 2.10+ defaults to torchcodec which may not be available.
-# Patch it to use soundfile (already installed) as fallback.
 import torchaudio
-_original_torchaudio_load = torchaudio.load
-
-def _soundfile_torchaudio_load(filepath, *args, **kwargs):
-    """Fallback torchaudio.load using soundfile when torchcodec is unavailable."""
-    try:
-        return _original_torchaudio_load(filepath, *args, **kwargs)
-    except (ImportError, RuntimeError):
-        data, samplerate = sf.read(str(filepath), dtype='float32')
-        waveform = torch.from_numpy(data)
-        if waveform.ndim == 1:
-            waveform = waveform.unsqueeze(0)  # (samples,) -> (1, samples)
-        else:
-            waveform = waveform.T  # (samples, channels) -> (channels, samples)
-        return waveform, samplerate
-
-torchaudio.load = _soundfile_torchaudio_load
-print("✅ Patched torchaudio.load with soundfile fallback")
+import onnxruntime as ort
+import soundfile as sf
+from export_speaker_encoder import export_speaker_encoder, reference_path
+from sklearn.metrics import silhouette_score
+from scipy.cluster.hierarchy import linkage, fcluster, dendrogram
+from scipy.spatial.distance import squareform
+
+# Per-segment diagnostics are DEBUG; set LOG_LEVEL=DEBUG to see them
+log_level_name = (os.environ.get('LOG_LEVEL') or 'INFO').strip().upper()
+# getLevelName maps known level names to their number and anything else to a string
+log_level = logging.getLevelName(log_level_name)
+logging.basicConfig(
+    level=log_level if isinstance(log_level, int) else logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger("diarization")
+if not isinstance(log_level, int):
+    logger.warning("⚠️  Unknown LOG_LEVEL %r, using INFO", log_level_name)
 
 app = FastAPI(title="Speaker Diarization Service")
 
 
-def convert_to_wav(input_path: str) -> str:
-    """Convert any audio format to WAV using pydub (ffmpeg backend).
-    Returns path to a new WAV temp file. Caller must clean up."""
+def decode_audio(input_path: str) -> Tuple[np.ndarray, int]:
+    """Decode any audio format to float32 samples, (samples,) or (samples, channels).
+    libsndfile reads WAV/FLAC/OGG directly (sniffing the header, so mislabeled
+    files still work); other formats are decoded in memory with pydub (ffmpeg)."""
+    try:
+        return sf.read(input_path, dtype='float32')
+    except RuntimeError:
+        pass
+
     from pydub import AudioSegment
-    wav_path = input_path + ".converted.wav"
     try:
         audio_seg = AudioSegment.from_file(input_path)
-        audio_seg.export(wav_path, format="wav")
-        print(f"✅ Converted audio to WAV: {wav_path}")
-        return wav_path
     except Exception as e:
-        print(f"❌ Audio conversion failed: {e}")
+        logger.error("❌ Audio decoding failed: %s", e)
         raise
 
+    # Integer PCM samples -> float32 in [-1, 1), without an intermediate WAV file
+    samples = np.array(audio_seg.get_array_of_samples(), dtype=np.float32)
+    samples /= float(1 << (8 * audio_seg.sample_width - 1))
+    if audio_seg.channels > 1:
+        samples = samples.reshape(-1, audio_seg.channels)
+    logger.info("✅ Decoded audio via ffmpeg: %dch @ %dHz", audio_seg.channels, audio_seg.frame_rate)
+    return samples, audio_seg.frame_rate
+
 # Global model cache
 model = None
 device = None
 
+# Recent /enroll results (LRU), keyed by SHA-256 of the uploaded bytes
+enroll_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+ENROLL_CACHE_SIZE = 128
+
+# Exported XTTS v2 speaker encoder; created from the full XTTS checkpoint on first start
+SPEAKER_ENCODER_ONNX_PATH = os.environ.get(
+    'SPEAKER_ENCODER_ONNX_PATH',
+    str(Path(__file__).resolve().parent / "speaker_encoder.onnx"),
+)
+# Reference waveform and its original XTTS embedding, written by the export
+SPEAKER_ENCODER_REFERENCE_PATH = reference_path(SPEAKER_ENCODER_ONNX_PATH)
+
+# XTTS's H/ASP speaker encoder runs on 16 kHz audio; uploads are resampled
+# straight to this rate so no second resample is needed before the encoder
+SAMPLE_RATE = 16000
+# Longest reference window fed to the speaker encoder, in seconds
+MAX_REF_SECONDS = 60
+# Speaker embedding size produced by the encoder
+EMBEDDING_DIM = 512
+# Shortest audio worth embedding, in seconds
+MIN_EMBEDDING_SECONDS = 0.5
+# Speaker encoder mel front end (XTTS v2 hifigan_decoder.speaker_encoder audio_config)
+PREEMPHASIS = 0.97
+MEL_N_FFT = 512
+MEL_WIN_LENGTH = 400
+MEL_HOP_LENGTH = 160
+MEL_N_MELS = 64
+# Mel frames per second of audio (centered STFT: frame k sits at sample k * hop)
+MEL_FRAME_RATE = SAMPLE_RATE / MEL_HOP_LENGTH
+# Frames per STFT call when computing a long recording's mel (bounds the complex intermediate)
+MEL_CHUNK_FRAMES = 6000
+# Cosine distance below which every pair of segments counts as one speaker:
+# each pair is at least as similar as the default YOU threshold (0.45)
+SINGLE_SPEAKER_MAX_DISTANCE = 1 - 0.45
+# Upload bytes copied to disk per read
+UPLOAD_CHUNK_SIZE = 1 << 20
+# Segments per speaker-encoder forward pass (bounds batch memory)
+EMBEDDING_BATCH_SIZE = 32
+# Segment mels are cropped down to a multiple of this many frames (0.25 s) so
+# equal-length segments can share a forward pass. Batches are never padded: the
+# encoder's instance norm and attention pooling run over time, so padded frames
+# would make an embedding depend on its batch partners.
+EMBEDDING_BUCKET_FRAMES = 25
+# CPU only: sub-batches run concurrently on this many threads (ONNX Runtime
+# releases the GIL), and the cores are split between their ONNX Runtime calls.
+# An unset or empty value means one worker per core.
+EMBEDDING_WORKERS = max(1, int(os.environ.get('EMBEDDING_WORKERS') or os.cpu_count() or 1))
+
 class SpeakerSegment(BaseModel):
     start: float
     end: float
@@ -76,131 +126,323 @@ class DiarizationResponse(BaseModel):
     segments: List[SpeakerSegment]
     num_speakers: int
 
+class OnnxSpeakerEncoder:
+    """XTTS v2 speaker encoder: torchaudio mel front end + ONNX Runtime network"""
+
+    def __init__(self, onnx_path: str, device: torch.device, intra_op_threads: int):
+        self.device = device
+
+        # Same front end the encoder runs internally (pre-emphasis -> hamming mel);
+        # centering is done in compute_mel so long inputs can be framed in chunks
+        self.preemphasis_filter = torch.tensor([[[-PREEMPHASIS, 1.0]]], device=device)
+        self.mel_spectrogram = torchaudio.transforms.MelSpectrogram(
+            sample_rate=SAMPLE_RATE,
+            n_fft=MEL_N_FFT,
+            win_length=MEL_WIN_LENGTH,
+            hop_length=MEL_HOP_LENGTH,
+            window_fn=torch.hamming_window,
+            n_mels=MEL_N_MELS,
+            center=False,
+        ).to(device)
+
+        sess_options = ort.SessionOptions()
+        sess_options.intra_op_num_threads = intra_op_threads
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        providers = ["CPUExecutionProvider"]
+        if device.type == "cuda" and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+        self.session = ort.InferenceSession(onnx_path, sess_options=sess_options, providers=providers)
+        # Where the network actually runs; the mel front end follows `device` regardless
+        self.uses_gpu = self.session.get_providers()[0] == "CUDAExecutionProvider"
+        logger.info("🧠 ONNX Runtime providers: %s", self.session.get_providers())
+
+    @torch.inference_mode()
+    def compute_mel(self, waveforms: torch.Tensor) -> torch.Tensor:
+        """(B, T) waveforms at SAMPLE_RATE -> (B, MEL_N_MELS, 1 + T // hop) mel power"""
+        x = waveforms.to(self.device).unsqueeze(1)
+        x = torch.nn.functional.pad(x, (1, 0), mode='reflect')
+        x = torch.nn.functional.conv1d(x, self.preemphasis_filter)
+        # Center the frames once up front, exactly as a centered STFT would
+        x = torch.nn.functional.pad(x, (MEL_N_FFT // 2, MEL_N_FFT // 2), mode='reflect').squeeze(1)
+
+        n_frames = 1 + (x.shape[-1] - MEL_N_FFT) // MEL_HOP_LENGTH
+        chunks = []
+        for start in range(0, n_frames, MEL_CHUNK_FRAMES):
+            stop = min(start + MEL_CHUNK_FRAMES, n_frames)
+            chunks.append(self.mel_spectrogram(x[:, start * MEL_HOP_LENGTH:(stop - 1) * MEL_HOP_LENGTH + MEL_N_FFT]))
+        return torch.cat(chunks, dim=-1)
+
+    def embed_mel(self, mel: torch.Tensor) -> np.ndarray:
+        """(B, MEL_N_MELS, frames) mel power -> (B, 512) L2-normalized float32 embeddings"""
+        return self.session.run(None, {"mel": mel.contiguous().cpu().numpy()})[0]
+
 def load_model():
-    """Load Coqui TTS model for speaker embeddings"""
+    """Load the ONNX speaker encoder, exporting it from XTTS v2 on first use"""
     global model, device
 
     if model is not None:
         return model, device
 
-    print("🔧 Loading Coqui TTS model for speaker embeddings...")
-
-    # Check for model path in environment
-    model_path = os.environ.get('COQUI_MODEL_PATH')
-
-    if not model_path or not Path(model_path).exists():
-        print("⚠️  COQUI_MODEL_PATH not set or invalid, downloading model...")
-        manager = ModelManager()
-        model_path, _, _ = manager.download_model("tts_models/multilingual/multi-dataset/xtts_v2")
-        print(f"📥 Downloaded model to: {model_path}")
-        # Config path is always in the model directory
-        config_path = Path(model_path) / "config.json"
-        print(f"📝 Config path: {config_path}")
-    else:
-        model_path = Path(model_path)
-        config_path = model_path / "config.json"
-        print(f"✅ Using model from: {model_path}")
-
     device_name = "cuda" if torch.cuda.is_available() else "cpu"
     device = torch.device(device_name)
-    print(f"🎯 Using device: {device_name}")
-
-    # Load config and setup model
-    print(f"📖 Loading config from: {config_path}")
-    config = load_config(str(config_path))
-    print("🏗️  Setting up model...")
-    model = setup_tts_model(config)
-    print(f"💾 Loading checkpoint from: {model_path}")
-
-    # Patch torch.load to use weights_only=False for XTTS (trusted source)
-    original_torch_load = torch.load
-    def patched_load(*args, **kwargs):
-        kwargs['weights_only'] = False
-        return original_torch_load(*args, **kwargs)
-
-    torch.load = patched_load
-    try:
-        model.load_checkpoint(
-            config,
-            checkpoint_dir=str(model_path),
-            eval=True,
-        )
-    finally:
-        torch.load = original_torch_load
+    logger.info("🎯 Using device: %s", device_name)
 
-    model.to(device)
+    ort_uses_gpu = device.type == "cuda" and "CUDAExecutionProvider" in ort.get_available_providers()
+    if device.type == "cuda" and not ort_uses_gpu:
+        logger.warning(
+            "⚠️  CUDA is available but ONNX Runtime has no CUDAExecutionProvider; the speaker "
+            "encoder network will run on CPU (install onnxruntime-gpu instead of onnxruntime)"
+        )
 
-    print("✅ Model loaded successfully")
+    intra_op_threads = os.cpu_count() or 1
+    if not ort_uses_gpu:
+        # Give each embedding worker its share of the cores so concurrent
+        # session.run calls don't oversubscribe them. Only the ORT session is
+        # limited: torch keeps every core for the request thread's resample and mel.
+        intra_op_threads = max(1, intra_op_threads // EMBEDDING_WORKERS)
+        logger.info("🧵 CPU embedding: %d workers x %d threads", EMBEDDING_WORKERS, intra_op_threads)
+
+    if not (Path(SPEAKER_ENCODER_ONNX_PATH).exists() and Path(SPEAKER_ENCODER_REFERENCE_PATH).exists()):
+        logger.warning("⚠️  ONNX speaker encoder or its reference not found, exporting it from XTTS v2...")
+        export_speaker_encoder(SPEAKER_ENCODER_ONNX_PATH)
+        # The full XTTS model is no longer referenced; hand its memory back
+        gc.collect()
+
+    model = OnnxSpeakerEncoder(SPEAKER_ENCODER_ONNX_PATH, device, intra_op_threads)
+    check_export_fidelity(model, SPEAKER_ENCODER_REFERENCE_PATH)
+    check_batch_invariance(model)
+
+    logger.info("✅ Model loaded successfully")
     return model, device
 
-def get_speaker_embedding(audio_path: str) -> np.ndarray:
-    """Extract speaker embedding from audio file using XTTS v2 get_conditioning_latents"""
-    try:
-        tts, device = load_model()
-
-        # Load audio to check duration
-        audio, sr = librosa.load(audio_path, sr=22050)
-
-        # Ensure minimum length (shorter threshold to process more segments)
-        duration = len(audio) / sr
-        if duration < 0.5:
-            print(f"⚠️  Audio too short: {duration:.2f}s (minimum 0.5s)")
-            return None
-
-        print(f"📊 Processing audio segment: {duration:.2f}s")
-
-        # Get conditioning latents (includes speaker embedding)
-        # gpt_cond_len: Number of seconds of audio to use for GPT conditioning
-        # max_ref_length: Maximum reference audio length in seconds
-        gpt_cond_latent, speaker_embedding = tts.get_conditioning_latents(
-            audio_path=audio_path,
-            gpt_cond_len=min(30, int(duration)),
-            max_ref_length=min(60, int(duration))
-        )
+@app.on_event("startup")
+def warm_model():
+    """Load the model before serving so no request pays the model load"""
+    load_model()
+
+def load_waveform(audio_path: str, device: torch.device) -> torch.Tensor:
+    """Decode an audio file once into a mono float32 tensor at SAMPLE_RATE on device"""
+    data, sr = decode_audio(audio_path)
+    waveform = torch.from_numpy(data)
+    if waveform.ndim > 1:
+        waveform = waveform.mean(dim=1)  # (samples, channels) -> (samples,)
+    waveform = waveform.to(device)
+    if sr != SAMPLE_RATE:
+        # Polyphase sinc resampling, on the GPU when one is available
+        waveform = torchaudio.functional.resample(waveform, sr, SAMPLE_RATE)
+    return waveform
+
+def extract_speaker_embeddings(
+    speaker_encoder: OnnxSpeakerEncoder,
+    segment_mels: List[Optional[torch.Tensor]]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Extract speaker embeddings for many mel slices with batched speaker-encoder passes.
+
+    Each input is cropped to at most MAX_REF_SECONDS, rounded down to a multiple of
+    EMBEDDING_BUCKET_FRAMES, and batched only with inputs of that same length, so its
+    embedding does not depend on which other inputs were passed alongside it.
+
+    Returns a preallocated (N, EMBEDDING_DIM) float32 matrix with one row per input,
+    and a boolean mask that is False where the input was missing, too short, or its
+    batch failed (those rows are left uninitialized).
+    """
+    emb_matrix = np.empty((len(segment_mels), EMBEDDING_DIM), dtype=np.float32)
+    valid_mask = np.zeros(len(segment_mels), dtype=bool)
+
+    max_frames = int(MAX_REF_SECONDS * MEL_FRAME_RATE)
 
-        # Convert to 1D numpy array
-        speaker_embedding_1D = speaker_embedding.view(-1).cpu().detach().numpy()
+    # Group inputs by cropped frame count; every batch is then a plain stack
+    buckets: Dict[int, List[int]] = {}
+    for i, mel in enumerate(segment_mels):
+        if mel is None:
+            continue
+        duration = mel.shape[-1] / MEL_FRAME_RATE
+        if duration < MIN_EMBEDDING_SECONDS:
+            logger.debug("⚠️  Audio %d too short: %.2fs (minimum %ss)", i, duration, MIN_EMBEDDING_SECONDS)
+            continue
+        n_frames = min(mel.shape[-1], max_frames) // EMBEDDING_BUCKET_FRAMES * EMBEDDING_BUCKET_FRAMES
+        buckets.setdefault(n_frames, []).append(i)
+    n_pending = sum(len(indices) for indices in buckets.values())
+
+    # With the network on CPU, split the work evenly so every worker thread gets a batch
+    batch_size = EMBEDDING_BATCH_SIZE
+    if not speaker_encoder.uses_gpu:
+        batch_size = max(1, min(batch_size, -(-n_pending // EMBEDDING_WORKERS)))
+    batches = [
+        (n_frames, indices[start:start + batch_size])
+        for n_frames, indices in buckets.items()
+        for start in range(0, len(indices), batch_size)
+    ]
+    logger.info("📊 Embedding %d segments in %d batches of up to %d", n_pending, len(batches), batch_size)
+
+    def embed_batch(n_frames: int, batch_indices: List[int]) -> None:
+        try:
+            # Same-length crops only: no padded frames ever reach the encoder
+            batch = torch.stack([segment_mels[i][:, :n_frames] for i in batch_indices])  # (B, MEL_N_MELS, frames)
+            # Encoder output lands directly in its rows; batches never share a row
+            emb_matrix[batch_indices] = speaker_encoder.embed_mel(batch)
+            valid_mask[batch_indices] = True
+        except Exception as e:
+            logger.exception("❌ Embedding extraction failed for batch of segments %s: %s", batch_indices, e)
+
+    if not speaker_encoder.uses_gpu and len(batches) > 1 and EMBEDDING_WORKERS > 1:
+        with ThreadPoolExecutor(max_workers=min(EMBEDDING_WORKERS, len(batches))) as executor:
+            list(executor.map(lambda batch: embed_batch(*batch), batches))
+    else:
+        # The GPU already serializes kernels, so batches run back to back
+        for n_frames, batch_indices in batches:
+            embed_batch(n_frames, batch_indices)
 
-        print(f"✅ Extracted embedding: shape={speaker_embedding_1D.shape}")
-        return speaker_embedding_1D
+    return emb_matrix, valid_mask
 
-    except Exception as e:
-        print(f"❌ Embedding extraction failed: {e}")
-        import traceback
-        traceback.print_exc()
+def get_speaker_embedding(speaker_encoder: OnnxSpeakerEncoder, audio: torch.Tensor) -> Optional[np.ndarray]:
+    """Extract speaker embedding from a mono waveform tensor sampled at SAMPLE_RATE"""
+    mel = speaker_encoder.compute_mel(audio.unsqueeze(0))[0]
+    emb_matrix, valid_mask = extract_speaker_embeddings(speaker_encoder, [mel])
+    if not valid_mask[0]:
         return None
+    logger.info("✅ Extracted embedding: shape=%s", emb_matrix[0].shape)
+    return emb_matrix[0]
 
-def split_audio_by_segments(audio_path: str, segments: List[Dict]) -> List[str]:
-    """Split audio file into segments based on timestamps"""
-    temp_dir = tempfile.mkdtemp()
-    segment_paths = []
-
-    # Load full audio
-    audio, sr = librosa.load(audio_path, sr=22050)
+def split_mel_by_segments(mel: torch.Tensor, segments: List[Dict]) -> List[Optional[torch.Tensor]]:
+    """Slice a full-recording mel spectrogram into per-segment frame views based on timestamps"""
+    segment_mels = []
 
     for i, seg in enumerate(segments):
-        start_sample = int(seg['start'] * sr)
-        end_sample = int(seg['end'] * sr)
+        start_frame = int(seg['start'] * MEL_FRAME_RATE)
+        end_frame = int(seg['end'] * MEL_FRAME_RATE)
 
-        # Extract segment
-        segment_audio = audio[start_sample:end_sample]
+        # Extract segment (a view into the full mel, no copy)
+        segment_mel = mel[:, start_frame:end_frame]
 
         # Skip very short segments (allow shorter segments for better diarization)
-        if len(segment_audio) < sr * 0.3:  # Minimum 0.3 seconds
-            print(f"⚠️  Segment {i} too short: {len(segment_audio)/sr:.2f}s, skipping")
-            segment_paths.append(None)
+        duration = segment_mel.shape[-1] / MEL_FRAME_RATE
+        if duration < 0.3:  # Minimum 0.3 seconds
+            logger.debug("⚠️  Segment %d too short: %.2fs, skipping", i, duration)
+            segment_mels.append(None)
             continue
 
-        # Save segment
-        seg_path = os.path.join(temp_dir, f"segment_{i:04d}.wav")
-        import soundfile as sf
-        sf.write(seg_path, segment_audio, sr)
-        segment_paths.append(seg_path)
+        segment_mels.append(segment_mel)
+
+    return segment_mels
+
+def check_export_fidelity(speaker_encoder: OnnxSpeakerEncoder, reference_path: str) -> None:
+    """Verify compute_mel + the ONNX network against the original XTTS encoder.
 
-    return segment_paths, temp_dir
+    The export saved a reference waveform with the embedding XTTS's own speaker
+    encoder (its waveform front end included) gave it. Raises RuntimeError if this
+    front end and the exported network no longer reproduce it.
+    """
+    reference = np.load(reference_path)
+    waveform = torch.from_numpy(reference["waveform"])
+    embedding = speaker_encoder.embed_mel(speaker_encoder.compute_mel(waveform.unsqueeze(0)))[0]
+    similarity = float(embedding @ reference["embedding"])  # Both are L2-normalized
+    if similarity < 0.999:
+        raise RuntimeError(
+            f"ONNX speaker encoder does not match XTTS on the reference waveform "
+            f"(cosine similarity {similarity:.4f}); check the mel front end or re-export"
+        )
+    logger.info("✅ ONNX speaker encoder matches XTTS (cosine similarity %.5f)", similarity)
+
+def check_batch_invariance(speaker_encoder: OnnxSpeakerEncoder) -> None:
+    """Verify that segments embedded together match each segment embedded alone.
+
+    Cuts segments of different lengths from one synthetic recording's mel, the way
+    /diarize does, and raises RuntimeError if any batched embedding drifts from its
+    single-item embedding (e.g. because padded frames reached the encoder).
+    """
+    # One more same-length segment than there are workers, so at least one batch
+    # holds two of them even when CPU work is spread across EMBEDDING_WORKERS
+    n_shared = EMBEDDING_WORKERS + 1
+    segments = [{"start": 0.5 * k, "end": 0.5 * (k + 1)} for k in range(n_shared)]
+    # Plus one segment in a different length bucket
+    segments.append({"start": 0.5 * n_shared, "end": 0.5 * n_shared + 0.8})
+
+    rng = np.random.default_rng(0)
+    n_samples = int((segments[-1]["end"] + 0.5) * SAMPLE_RATE)
+    waveform = torch.from_numpy(0.1 * rng.standard_normal(n_samples).astype(np.float32))
+    full_mel = speaker_encoder.compute_mel(waveform.unsqueeze(0))[0].cpu()
+    segment_mels = split_mel_by_segments(full_mel, segments)
+
+    batched, batched_mask = extract_speaker_embeddings(speaker_encoder, segment_mels)
+    for i, mel in enumerate(segment_mels):
+        single, single_mask = extract_speaker_embeddings(speaker_encoder, [mel])
+        if not (batched_mask[i] and single_mask[0]):
+            raise RuntimeError(f"Batch invariance check: segment {i} produced no embedding")
+        similarity = float(batched[i] @ single[0])  # Both rows are L2-normalized
+        if similarity < 0.999:
+            raise RuntimeError(
+                f"Batch invariance check: segment {i} embedded in a batch differs from "
+                f"embedding it alone (cosine similarity {similarity:.4f})"
+            )
+    logger.info("✅ Batched embeddings match single-segment embeddings")
+
+def cosine_distances(X: np.ndarray) -> np.ndarray:
+    """Square float32 cosine distance matrix between rows, from one GEMM on L2-normalized rows"""
+    X = np.asarray(X, dtype=np.float32)
+    E = X / np.linalg.norm(X, axis=1, keepdims=True)
+    dist = 1.0 - E @ E.T
+    np.clip(dist, 0.0, None, out=dist)  # Rounding can push near-identical pairs below zero
+    np.fill_diagonal(dist, 0.0)  # silhouette_score rejects a non-zero diagonal
+    return dist
+
+def find_best_cluster_count(
+    linkage_matrix: np.ndarray,
+    square_distances: np.ndarray,
+    max_clusters: int,
+    default_n: int
+) -> Tuple[int, float]:
+    """
+    Cut an existing linkage tree at 2..max_clusters and pick the best silhouette score
+
+    Args:
+        linkage_matrix: Linkage computed once from the condensed distances
+        square_distances: Square form of the distances the linkage was built from
+        max_clusters: Largest cluster count to try
+        default_n: Cluster count returned when no cut yields a usable score
+
+    Returns:
+        (best cluster count, its silhouette score or -1 if none was scored)
+    """
+    best_score = -1
+    best_n = default_n
+
+    for n in range(2, max_clusters + 1):
+        labels = fcluster(linkage_matrix, t=n, criterion='maxclust')
+
+        if len(set(labels)) > 1:
+            score = silhouette_score(square_distances, labels, metric='precomputed')
+            if score > best_score:
+                best_score = score
+                best_n = n
+
+    return best_n, best_score
+
+def classify_against_user(
+    X: np.ndarray,
+    user_embedding: np.ndarray,
+    similarity_threshold: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score embeddings against the user's voice; pure numerics, no logging
+
+    Args:
+        X: (N, 512) stacked segment embeddings
+        user_embedding: The user's reference voice embedding
+        similarity_threshold: Cosine similarity at or above which a segment is the user
+
+    Returns:
+        (boolean user mask, cosine similarities), both of shape (N,)
+    """
+    # Cosine similarity of every row with the user's embedding, as one matvec
+    E = X / np.linalg.norm(X, axis=1, keepdims=True)
+    u = user_embedding.astype(np.float32) / np.linalg.norm(user_embedding)
+    similarities = E @ u
+    return similarities >= similarity_threshold, similarities
 
 def cluster_speakers_personalized(
-    embeddings: List[np.ndarray],
+    emb_matrix: np.ndarray,
+    valid_mask: np.ndarray,
     user_embedding: np.ndarray,
     similarity_threshold: float = 0.45
 ) -> List[str]:
@@ -208,104 +450,81 @@ def cluster_speakers_personalized(
     Cluster embeddings with personalized labels: YOU for user, OTHER for others
 
     Args:
-        embeddings: List of speaker embeddings for each segment
+        emb_matrix: (N, EMBEDDING_DIM) speaker embeddings, one row per segment
+        valid_mask: (N,) True for rows that hold an embedding
         user_embedding: The user's reference voice embedding
         similarity_threshold: Cosine similarity threshold to identify user (default 0.75)
 
     Returns:
         List of speaker labels: "YOU", "OTHER", "OTHER_1", "OTHER_2", etc.
     """
-    from scipy.spatial.distance import cosine
-
-    if not embeddings:
+    if len(emb_matrix) == 0:
         return []
 
     # Create mapping for valid embeddings
-    valid_indices = [i for i, e in enumerate(embeddings) if e is not None]
-    valid_embeddings = [embeddings[i] for i in valid_indices]
-
-    if not valid_embeddings:
-        print("⚠️  No valid embeddings extracted, using single speaker")
-        return ["YOU"] * len(embeddings)
-
-    # Compare each embedding with user's embedding
-    all_labels = []
-    other_embeddings = []  # Track non-user embeddings for clustering
-    other_indices = []  # Track which segments are non-user
-
-    # Track all similarity scores for statistics
-    all_similarities = []
-    you_similarities = []
-    other_similarities = []
-
-    print(f"\n🎯 Personalized Diarization (threshold={similarity_threshold:.2f})")
-    print(f"   User embedding shape: {user_embedding.shape}")
-
-    for i, emb in enumerate(embeddings):
-        if emb is None:
-            all_labels.append("YOU")  # Default to user for skipped segments
-            print(f"  Segment {i}: YOU (skipped - no embedding)")
-            continue
-
-        # Calculate cosine similarity with user embedding
-        similarity = 1 - cosine(emb, user_embedding)
-        all_similarities.append(similarity)
-
-        if similarity >= similarity_threshold:
-            all_labels.append("YOU")
-            you_similarities.append(similarity)
-            print(f"  ✅ Segment {i}: YOU (similarity={similarity:.3f})")
-        else:
-            # This is someone else - cluster later
-            all_labels.append(None)  # Placeholder
-            other_embeddings.append(emb)
-            other_similarities.append(similarity)
-            other_indices.append(i)
-            print(f"  ❌ Segment {i}: OTHER (similarity={similarity:.3f})")
+    valid_indices = np.flatnonzero(valid_mask)
+
+    if len(valid_indices) == 0:
+        logger.warning("⚠️  No valid embeddings extracted, using single speaker")
+        return ["YOU"] * len(emb_matrix)
+
+    # One gather into a contiguous (n_valid, EMBEDDING_DIM) block, ready for BLAS
+    X_valid = emb_matrix[valid_mask]
+    is_user, all_similarities = classify_against_user(X_valid, user_embedding, similarity_threshold)
+
+    you_similarities = all_similarities[is_user]
+    other_similarities = all_similarities[~is_user]
+    other_embeddings = X_valid[~is_user]  # Non-user embeddings for clustering
+    other_indices = valid_indices[~is_user].tolist()  # Which segments are non-user
+
+    # Skipped segments default to the user; non-user placeholders are filled in below
+    all_labels = ["YOU"] * len(emb_matrix)
+    for i in other_indices:
+        all_labels[i] = None
+
+    logger.info(
+        "🎯 Personalized Diarization (threshold=%.2f, user embedding shape=%s)",
+        similarity_threshold, user_embedding.shape,
+    )
+
+    # Per-segment lines are only worth building when someone will see them
+    if logger.isEnabledFor(logging.DEBUG):
+        similarity_by_index = dict(zip(valid_indices.tolist(), all_similarities))
+        for i, label in enumerate(all_labels):
+            if i not in similarity_by_index:
+                logger.debug("  Segment %d: YOU (skipped - no embedding)", i)
+            elif label == "YOU":
+                logger.debug("  ✅ Segment %d: YOU (similarity=%.3f)", i, similarity_by_index[i])
+            else:
+                logger.debug("  ❌ Segment %d: OTHER (similarity=%.3f)", i, similarity_by_index[i])
 
     # If there are multiple "OTHER" speakers, cluster them
     if len(other_embeddings) > 1:
-        X = np.vstack(other_embeddings)
-
-        # Standardize
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
+        X = other_embeddings
 
         # Determine optimal number of clusters
-        linkage_matrix = linkage(X_scaled, method='ward')
-        distances = pdist(X_scaled, metric='euclidean')
-        max_distance = np.max(distances)
+        # Pairwise distances are computed once and shared with the linkage
+        square_distances = cosine_distances(X)
+        distances = squareform(square_distances, checks=False)  # condensed
+        linkage_matrix = linkage(distances, method='average')
+        max_distance = distances.max()
 
         # If distances are small, likely same speaker
-        if max_distance < 19 or len(X) < 2:
+        if max_distance < SINGLE_SPEAKER_MAX_DISTANCE or len(X) < 2:
             n_clusters = 1
         else:
             # Try to find optimal clusters
-            from sklearn.metrics import silhouette_score
-            best_score = -1
-            best_n = 1
             max_clusters = min(5, len(X) - 1)  # Max 5 other speakers
-
-            for n in range(2, max_clusters + 1):
-                clustering = AgglomerativeClustering(n_clusters=n, linkage='ward')
-                labels = clustering.fit_predict(X_scaled)
-
-                if len(set(labels)) > 1:
-                    score = silhouette_score(X_scaled, labels)
-                    if score > best_score:
-                        best_score = score
-                        best_n = n
-
+            best_n, best_score = find_best_cluster_count(linkage_matrix, square_distances, max_clusters, default_n=1)
             n_clusters = best_n if best_score > 0.2 else 1
 
-        print(f"📊 Detected {n_clusters} other speaker(s) besides YOU")
+        logger.info("📊 Detected %d other speaker(s) besides YOU", n_clusters)
 
         # Cluster the "OTHER" embeddings
         if n_clusters == 1:
             other_labels = ["OTHER"] * len(other_embeddings)
         else:
-            clustering = AgglomerativeClustering(n_clusters=n_clusters, linkage='ward')
-            cluster_ids = clustering.fit_predict(X_scaled)
+            cluster_ids = fcluster(linkage_matrix, t=n_clusters, criterion='maxclust') - 1
             other_labels = [f"OTHER_{label}" for label in cluster_ids]
 
         # Fill in the "OTHER" labels
@@ -316,106 +535,81 @@ def cluster_speakers_personalized(
         # Only one "OTHER" segment
         all_labels[other_indices[0]] = "OTHER"
 
-    # Print summary statistics
+    # Log summary statistics
     you_count = sum(1 for label in all_labels if label == "YOU")
     other_count = len(all_labels) - you_count
 
-    print(f"\n📈 Similarity Statistics:")
-    print(f"   Total segments: {len(all_labels)}")
-    print(f"   YOU: {you_count} segments ({you_count/len(all_labels)*100:.1f}%)")
-    print(f"   OTHER: {other_count} segments ({other_count/len(all_labels)*100:.1f}%)")
+    logger.info(
+        "📈 %d segments: YOU %d (%.1f%%), OTHER %d (%.1f%%)",
+        len(all_labels),
+        you_count, you_count / len(all_labels) * 100,
+        other_count, other_count / len(all_labels) * 100,
+    )
 
-    if all_similarities:
-        print(f"   All similarities: min={min(all_similarities):.3f}, max={max(all_similarities):.3f}, avg={np.mean(all_similarities):.3f}")
-    if you_similarities:
-        print(f"   YOU similarities: min={min(you_similarities):.3f}, max={max(you_similarities):.3f}, avg={np.mean(you_similarities):.3f}")
-    if other_similarities:
-        print(f"   OTHER similarities: min={min(other_similarities):.3f}, max={max(other_similarities):.3f}, avg={np.mean(other_similarities):.3f}")
+    for name, similarities in (("All", all_similarities), ("YOU", you_similarities), ("OTHER", other_similarities)):
+        if similarities.size:
+            logger.info(
+                "   %s similarities: min=%.3f, max=%.3f, avg=%.3f",
+                name, similarities.min(), similarities.max(), similarities.mean(),
+            )
 
     # Warn if many segments are close to threshold
-    close_to_threshold = [s for s in all_similarities if abs(s - similarity_threshold) < 0.05]
-    if len(close_to_threshold) > len(all_similarities) * 0.3:
-        print(f"   ⚠️  Warning: {len(close_to_threshold)} segments are close to threshold (±0.05)")
-        print(f"      Consider adjusting threshold or re-enrolling voice profile with better audio")
+    close_to_threshold = np.count_nonzero(np.abs(all_similarities - similarity_threshold) < 0.05)
+    if close_to_threshold > all_similarities.size * 0.3:
+        logger.warning(
+            "⚠️  %d segments are close to threshold (±0.05); consider adjusting threshold "
+            "or re-enrolling voice profile with better audio",
+            close_to_threshold,
+        )
 
     return all_labels
 
-def cluster_speakers(embeddings: List[np.ndarray], segments: List[Dict]) -> List[str]:
-    """Cluster embeddings to identify speakers"""
-    if not embeddings:
+def cluster_speakers(emb_matrix: np.ndarray, valid_mask: np.ndarray, segments: List[Dict]) -> List[str]:
+    """Cluster embeddings (rows of emb_matrix where valid_mask is set) to identify speakers"""
+    if len(emb_matrix) == 0:
         return []
 
-    # Create mapping for valid embeddings
-    valid_indices = [i for i, e in enumerate(embeddings) if e is not None]
-    valid_embeddings = [embeddings[i] for i in valid_indices]
-
-    if not valid_embeddings:
-        print("⚠️  No valid embeddings extracted, using single speaker")
-        return ["speaker_0"] * len(embeddings)
+    if not valid_mask.any():
+        logger.warning("⚠️  No valid embeddings extracted, using single speaker")
+        return ["speaker_0"] * len(emb_matrix)
 
-    # Stack embeddings
-    X = np.vstack(valid_embeddings)
+    # One gather into a contiguous (n_valid, EMBEDDING_DIM) block, ready for BLAS
+    X = emb_matrix[valid_mask]
 
     if len(X) < 2:
-        return ["speaker_0"] * len(embeddings)
-
-    # Standardize
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+        return ["speaker_0"] * len(emb_matrix)
 
     # Determine optimal number of clusters
     # Use hierarchical clustering
-    linkage_matrix = linkage(X_scaled, method='ward')
-    distances = pdist(X_scaled, metric='euclidean')
-    max_distance = np.max(distances)
+    # Pairwise distances are computed once and shared with the linkage
+    square_distances = cosine_distances(X)
+    distances = squareform(square_distances, checks=False)  # condensed
+    linkage_matrix = linkage(distances, method='average')
+    max_distance = distances.max()
 
     # Heuristic: if max distance > threshold, likely multiple speakers
-    two_speaker_threshold = 19
-
-    if max_distance < two_speaker_threshold:
+    if max_distance < SINGLE_SPEAKER_MAX_DISTANCE:
         n_clusters = 1
     else:
         # Try 2-10 clusters, pick best silhouette score
-        from sklearn.metrics import silhouette_score
-        best_score = -1
-        best_n = 2
-
         # Maximum clusters is len(X) - 1 to ensure silhouette_score can work
         max_clusters = min(10, len(X) - 1)
-        for n in range(2, max_clusters + 1):
-            clustering = AgglomerativeClustering(n_clusters=n, linkage='ward')
-            labels = clustering.fit_predict(X_scaled)
-
-            if len(set(labels)) > 1:
-                score = silhouette_score(X_scaled, labels)
-                if score > best_score:
-                    best_score = score
-                    best_n = n
-
-        n_clusters = best_n
+        n_clusters, _ = find_best_cluster_count(linkage_matrix, square_distances, max_clusters, default_n=2)
 
-    print(f"📊 Detected {n_clusters} speakers")
+    logger.info("📊 Detected %d speakers", n_clusters)
 
     # Final clustering
     if n_clusters == 1:
-        return ["speaker_0"] * len(embeddings)
+        return ["speaker_0"] * len(emb_matrix)
 
-    clustering = AgglomerativeClustering(n_clusters=n_clusters, linkage='ward')
-    valid_labels = clustering.fit_predict(X_scaled)
+    valid_labels = fcluster(linkage_matrix, t=n_clusters, criterion='maxclust') - 1
 
-    # Map labels back to all embeddings (None embeddings get most common label)
+    # Map labels back to all segments (segments without an embedding get most common label)
     most_common_label = np.bincount(valid_labels).argmax()
-    all_labels = []
-    valid_label_idx = 0
+    all_label_ids = np.full(len(emb_matrix), most_common_label)
+    all_label_ids[valid_mask] = valid_labels
 
-    for i, emb in enumerate(embeddings):
-        if emb is not None:
-            all_labels.append(f"speaker_{valid_labels[valid_label_idx]}")
-            valid_label_idx += 1
-        else:
-            all_labels.append(f"speaker_{most_common_label}")
-
-    return all_labels
+    return [f"speaker_{label}" for label in all_label_ids]
 
 @app.post("/diarize", response_model=DiarizationResponse)
 async def diarize_audio(
@@ -432,60 +626,48 @@ async def diarize_audio(
                  Example: [{"start": 0.0, "end": 2.5, "text": "Hello"}]
     """
     temp_audio = None
-    temp_dir = None
-    wav_path = None
 
     try:
-        print(f"🔍 Diarization request received - segments parameter: {segments is not None}")
-        print(f"   Audio filename: {audio.filename}, content_type: {audio.content_type}")
+        logger.info(
+            "🔍 Diarization request received - segments parameter: %s, filename: %s, content_type: %s",
+            segments is not None, audio.filename, audio.content_type,
+        )
         if segments:
-            print(f"📦 Segments data length: {len(segments)} chars")
+            logger.debug("📦 Segments data length: %d chars", len(segments))
 
         # Save uploaded audio to temp file with original extension
         ext = Path(audio.filename).suffix if audio.filename else ".webm"
         temp_audio = tempfile.NamedTemporaryFile(delete=False, suffix=ext)
-        temp_audio.write(await audio.read())
+        # Stream to disk in chunks rather than holding the whole upload in memory
+        while chunk := await audio.read(UPLOAD_CHUNK_SIZE):
+            temp_audio.write(chunk)
         temp_audio.close()
 
-        # Always convert to proper WAV via pydub (handles mislabeled formats)
-        wav_path = convert_to_wav(temp_audio.name)
-        audio_file = wav_path
+        # Decode once; every segment below is cut from this recording
+        waveform = load_waveform(temp_audio.name, device)
 
         # Parse segments if provided
         import json
         if segments:
             segment_list = json.loads(segments)
-            print(f"📥 Received {len(segment_list)} segments:")
+            logger.info("📥 Received %d segments", len(segment_list))
             for i, seg in enumerate(segment_list[:3]):  # Show first 3
-                print(f"  Segment {i}: start={seg.get('start')}, end={seg.get('end')}, text='{seg.get('text', '')[:50]}'")
+                logger.debug("  Segment %d: start=%s, end=%s, text='%s'", i, seg.get('start'), seg.get('end'), seg.get('text', '')[:50])
         else:
-            print("⚠️  No segments provided, treating whole audio as one segment")
+            logger.warning("⚠️  No segments provided, treating whole audio as one segment")
             # If no segments, treat whole audio as one segment
-            duration = librosa.get_duration(path=audio_file)
+            duration = waveform.shape[-1] / SAMPLE_RATE
             segment_list = [{"start": 0.0, "end": duration, "text": ""}]
 
-        print(f"🎤 Processing {len(segment_list)} segments...")
-
-        # Split audio by segments
-        segment_paths, temp_dir = split_audio_by_segments(audio_file, segment_list)
+        logger.info("🎤 Processing %d segments...", len(segment_list))
 
-        # Extract embeddings for each segment
-        embeddings = []
-        valid_segment_indices = []  # Track which segments are valid
+        # One STFT + mel over the whole recording; segments are slices of its frames.
+        # It moves to host once, since ONNX Runtime takes its inputs from there.
+        full_mel = model.compute_mel(waveform.unsqueeze(0))[0].cpu()
+        segment_mels = split_mel_by_segments(full_mel, segment_list)
 
-        for i, seg_path in enumerate(segment_paths):
-            if seg_path is None:
-                embeddings.append(None)
-                continue
-
-            try:
-                embedding = get_speaker_embedding(seg_path)
-                embeddings.append(embedding)
-                if embedding is not None:
-                    valid_segment_indices.append(i)
-            except Exception as e:
-                print(f"⚠️  Failed to extract embedding: {e}")
-                embeddings.append(None)
+        # Extract embeddings for all segments in batched forward passes
+        emb_matrix, valid_mask = extract_speaker_embeddings(model, segment_mels)
 
         # Parse user embedding if provided
         user_emb = None
@@ -493,18 +675,18 @@ async def diarize_audio(
             try:
                 user_emb_list = json.loads(user_embedding)
                 user_emb = np.array(user_emb_list, dtype=np.float32)
-                print(f"👤 User embedding provided: shape={user_emb.shape}")
+                logger.info("👤 User embedding provided: shape=%s", user_emb.shape)
             except Exception as e:
-                print(f"⚠️  Failed to parse user embedding: {e}")
+                logger.warning("⚠️  Failed to parse user embedding: %s", e)
 
         # Cluster speakers (personalized if user embedding provided)
-        print(f"🔬 Clustering {len([e for e in embeddings if e is not None])} valid embeddings...")
-        if user_emb is not None and len(user_emb) == 512:
-            speaker_labels = cluster_speakers_personalized(embeddings, user_emb)
-            print(f"🎯 Personalized clustering complete: {speaker_labels}")
+        logger.info("🔬 Clustering %d valid embeddings...", np.count_nonzero(valid_mask))
+        if user_emb is not None and len(user_emb) == EMBEDDING_DIM:
+            speaker_labels = cluster_speakers_personalized(emb_matrix, valid_mask, user_emb)
+            logger.debug("🎯 Personalized clustering complete: %s", speaker_labels)
         else:
-            speaker_labels = cluster_speakers(embeddings, segment_list)
-            print(f"🎯 Standard clustering complete: {speaker_labels}")
+            speaker_labels = cluster_speakers(emb_matrix, valid_mask, segment_list)
+            logger.debug("🎯 Standard clustering complete: %s", speaker_labels)
 
         # Build response - ensure we preserve text from original segments
         unique_speakers = sorted(set(speaker_labels))
@@ -519,7 +701,7 @@ async def diarize_audio(
                 text=seg.get('text', '')
             ))
 
-        print(f"📝 Returning {len(response_segments)} segments with speakers")
+        logger.info("📝 Returning %d segments with speakers", len(response_segments))
 
         return DiarizationResponse(
             speakers=unique_speakers,
@@ -528,19 +710,13 @@ async def diarize_audio(
         )
 
     except Exception as e:
-        print(f"❌ Diarization failed with error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Diarization failed with error: %s", e)
         raise HTTPException(status_code=500, detail=f"Diarization failed: {str(e)}")
 
     finally:
         # Cleanup
         if temp_audio and os.path.exists(temp_audio.name):
             os.unlink(temp_audio.name)
-        if wav_path and os.path.exists(wav_path):
-            os.unlink(wav_path)
-        if temp_dir and os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
 
 @app.post("/enroll")
 async def enroll_voice(
@@ -556,45 +732,56 @@ async def enroll_voice(
         {"embedding": [512-dim array]}
     """
     temp_audio = None
-    wav_path = None
 
     try:
-        print(f"🎤 Voice enrollment request received (filename: {audio.filename}, content_type: {audio.content_type})")
+        logger.info("🎤 Voice enrollment request received (filename: %s, content_type: %s)", audio.filename, audio.content_type)
 
         # Save uploaded audio to temp file with original extension
         ext = Path(audio.filename).suffix if audio.filename else ".webm"
         temp_audio = tempfile.NamedTemporaryFile(delete=False, suffix=ext)
-        temp_audio.write(await audio.read())
+        # Stream to disk in chunks, hashing each chunk on the way through
+        digest = hashlib.sha256()
+        while chunk := await audio.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            temp_audio.write(chunk)
         temp_audio.close()
 
-        # Always convert to proper WAV via pydub (handles mislabeled formats)
-        wav_path = convert_to_wav(temp_audio.name)
-        audio_path = wav_path
+        # Re-enrolling the exact same audio yields the exact same embedding
+        cache_key = digest.hexdigest()
+        cached_embedding = enroll_cache.get(cache_key)
+        if cached_embedding is not None:
+            enroll_cache.move_to_end(cache_key)
+            logger.info("♻️  Returning cached voice embedding for identical upload")
+            return {
+                "embedding": cached_embedding
+            }
 
         # Extract speaker embedding from the whole file
-        embedding = get_speaker_embedding(audio_path)
+        waveform = load_waveform(temp_audio.name, device)
+        embedding = get_speaker_embedding(model, waveform)
 
         if embedding is None:
             raise HTTPException(status_code=400, detail="Failed to extract voice embedding. Audio may be too short or invalid.")
 
-        print(f"✅ Voice embedding extracted: shape={embedding.shape}")
+        logger.info("✅ Voice embedding extracted: shape=%s", embedding.shape)
+
+        embedding_list = embedding.tolist()
+        enroll_cache[cache_key] = embedding_list
+        if len(enroll_cache) > ENROLL_CACHE_SIZE:
+            enroll_cache.popitem(last=False)
 
         return {
-            "embedding": embedding.tolist()
+            "embedding": embedding_list
         }
 
     except Exception as e:
-        print(f"❌ Voice enrollment failed: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Voice enrollment failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Voice enrollment failed: {str(e)}")
 
     finally:
         # Cleanup
         if temp_audio and os.path.exists(temp_audio.name):
             os.unlink(temp_audio.name)
-        if wav_path and os.path.exists(wav_path):
-            os.unlink(wav_path)
 
 @app.get("/health")
 async def health_check():